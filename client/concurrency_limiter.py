@@ -0,0 +1,343 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Adaptive concurrency limiting for prediction requests.
+
+When clients send requests faster than the model servers can process them,
+requests pile up in the server queues, every request waits longer, and
+latency collapses. An adaptive limiter caps the number of requests in flight
+and adjusts that cap based on the latency it observes, so excess work is
+queued briefly on the client (with a bounded queue) or shed immediately
+instead of being sent to an already overloaded server.
+
+Two limit algorithms are provided:
+  * AIMDLimit: additive increase, multiplicative decrease, like TCP
+    congestion control. The limit backs off whenever a request fails or its
+    smoothed latency exceeds a threshold.
+  * GradientLimit: compares the smoothed latency with a no-load baseline,
+    and shrinks the limit in proportion to how much latency has grown.
+"""
+
+from __future__ import division
+
+import collections
+import threading
+import time
+
+
+class RequestRejectedError(Exception):
+  """Raised when a request is shed because the limiter queue is full."""
+  pass
+
+
+class _LatencyLimit(object):
+  """Latency tracking shared by AIMDLimit and GradientLimit.
+
+  Single requests are too noisy to tell queueing apart from ordinary
+  variation in service time, so the limits compare a smoothed latency, an
+  exponential moving average over about smoothing_window requests, with a
+  baseline: the lowest smoothed latency seen over the last one to two windows
+  of requests.
+
+  Under sustained load every request queues on the server, and the baseline
+  would drift up along with latency. To measure the no-load latency again, at
+  the end of every window the limit is halved for a probe period long enough
+  for the smoothed latency to catch up. If latency stays high through the
+  probe, the server has really slowed down and the higher baseline is kept.
+  """
+
+  def __init__(self, initial_limit, min_limit, max_limit, smoothing_window,
+               window):
+    self._limit = float(initial_limit)
+    self.min_limit = min_limit
+    self.max_limit = max_limit
+    self.smoothing_window = smoothing_window
+    self.window = window
+    self.smoothed_latency_ms = None
+    self._previous_min_ms = None
+    self._current_min_ms = None
+    self._count = 0
+    self._probe_remaining = 0
+
+  @property
+  def limit(self):
+    if self._probe_remaining > 0:
+      return max(self.min_limit, int(self._limit / 2))
+    return int(self._limit)
+
+  @property
+  def baseline_latency_ms(self):
+    mins = [m for m in (self._previous_min_ms, self._current_min_ms)
+            if m is not None]
+    return min(mins) if mins else None
+
+  def _track(self, latency_ms):
+    """Record a latency, returning False while the limit is being probed."""
+    if self.smoothed_latency_ms is None:
+      self.smoothed_latency_ms = latency_ms
+    else:
+      self.smoothed_latency_ms += 2 / (self.smoothing_window + 1) * (
+          latency_ms - self.smoothed_latency_ms)
+    if (self._current_min_ms is None or
+        self.smoothed_latency_ms < self._current_min_ms):
+      self._current_min_ms = self.smoothed_latency_ms
+    self._count += 1
+    if self._count >= self.window:
+      self._previous_min_ms = self._current_min_ms
+      self._current_min_ms = None
+      self._count = 0
+      # Requests sent before the probe keep completing for one round trip,
+      # i.e. about limit requests, before the smoothed latency can respond.
+      self._probe_remaining = int(self._limit) + 2 * self.smoothing_window
+    if self._probe_remaining > 0:
+      self._probe_remaining -= 1
+      return False
+    return True
+
+
+class AIMDLimit(_LatencyLimit):
+  """Additive increase, multiplicative decrease concurrency limit.
+
+  While the smoothed latency is below the latency threshold, each successful
+  request grows the limit by 1 / limit, i.e. by roughly one per limit's worth
+  of requests. A failed request, or a smoothed latency above the threshold,
+  shrinks the limit by backoff_ratio, at most once per smoothing_window
+  requests so that a single slow period is only counted once.
+
+  Unless latency_threshold_ms is given, the threshold is latency_tolerance
+  times the baseline latency. A lower tolerance keeps latency closer to the
+  no-load latency but leaves less room for normal variation in service time,
+  so more requests are shed.
+  """
+
+  def __init__(self, initial_limit=4, min_limit=1, max_limit=64,
+               backoff_ratio=0.9, latency_threshold_ms=None,
+               latency_tolerance=1.5, smoothing_window=50, window=500):
+    """Create an AIMD limit.
+
+    Args:
+      initial_limit: number of concurrent requests allowed at the start
+      min_limit: the limit never drops below this value
+      max_limit: the limit never grows above this value
+      backoff_ratio: multiplier applied to the limit on a slow or failed
+        request, between 0 and 1
+      latency_threshold_ms: smoothed latency above which requests count as
+        congestion. Defaults to latency_tolerance times the baseline latency
+      latency_tolerance: multiple of the baseline latency above which
+        requests count as congestion
+      smoothing_window: number of requests averaged into the smoothed latency
+      window: number of requests between probes of the no-load latency
+    """
+    if not 0 < backoff_ratio < 1:
+      raise ValueError('backoff_ratio must be between 0 and 1')
+    super(AIMDLimit, self).__init__(
+        initial_limit, min_limit, max_limit, smoothing_window, window)
+    self.backoff_ratio = backoff_ratio
+    self.latency_threshold_ms = latency_threshold_ms
+    self.latency_tolerance = latency_tolerance
+    self._since_backoff = smoothing_window
+
+  def _backoff(self):
+    if self._since_backoff >= self.smoothing_window:
+      self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+      self._since_backoff = 0
+
+  def update(self, latency_ms, in_flight, dropped):
+    """Update the limit from one completed request.
+
+    Args:
+      latency_ms: round trip time of the request in milliseconds
+      in_flight: number of requests in flight when the request was sent
+      dropped: True if the request failed, e.g. its deadline expired
+    """
+    self._since_backoff += 1
+    if dropped:
+      self._backoff()
+      return
+    if not self._track(latency_ms):
+      return
+    threshold_ms = self.latency_threshold_ms
+    if threshold_ms is None:
+      threshold_ms = self.latency_tolerance * self.baseline_latency_ms
+    if self.smoothed_latency_ms > threshold_ms:
+      self._backoff()
+    elif in_flight * 2 >= self._limit:
+      # Only grow when the limit is actually being used, otherwise an idle
+      # client would inflate its limit without ever testing it.
+      self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+
+class GradientLimit(_LatencyLimit):
+  """Latency gradient concurrency limit.
+
+  For each request, the gradient is latency_tolerance * baseline / smoothed
+  latency, clamped to [0.5, 1]. The new limit is limit * gradient plus a
+  constant headroom of queue_size requests. While latency stays within the
+  tolerance of the baseline the limit grows; once requests queue on the
+  server, latency grows with the limit and the limit settles a little above
+  the server's capacity.
+  """
+
+  def __init__(self, initial_limit=4, min_limit=1, max_limit=64,
+               queue_size=4, latency_tolerance=1.5, smoothing=0.2,
+               smoothing_window=50, window=500):
+    """Create a gradient limit.
+
+    Args:
+      initial_limit: number of concurrent requests allowed at the start
+      min_limit: the limit never drops below this value
+      max_limit: the limit never grows above this value
+      queue_size: number of requests allowed to queue on the server
+      latency_tolerance: multiple of the baseline latency that is not yet
+        treated as queueing
+      smoothing: weight of each new limit estimate, between 0 and 1
+      smoothing_window: number of requests averaged into the smoothed latency
+      window: number of requests between probes of the no-load latency
+    """
+    super(GradientLimit, self).__init__(
+        initial_limit, min_limit, max_limit, smoothing_window, window)
+    self.queue_size = queue_size
+    self.latency_tolerance = latency_tolerance
+    self.smoothing = smoothing
+
+  def update(self, latency_ms, in_flight, dropped):
+    """Update the limit from one completed request.
+
+    Args:
+      latency_ms: round trip time of the request in milliseconds
+      in_flight: number of requests in flight when the request was sent
+      dropped: True if the request failed, e.g. its deadline expired
+    """
+    if dropped:
+      self._limit = max(self.min_limit, self._limit / 2)
+      return
+    if not self._track(latency_ms):
+      return
+    # Don't grow a limit that isn't being used.
+    if in_flight * 2 < self._limit:
+      return
+    gradient = max(0.5, min(1.0, self.latency_tolerance *
+                            self.baseline_latency_ms /
+                            max(self.smoothed_latency_ms, 1e-3)))
+    new_limit = self._limit * gradient + self.queue_size
+    new_limit = (1 - self.smoothing) * self._limit + self.smoothing * new_limit
+    self._limit = max(self.min_limit, min(self.max_limit, new_limit))
+
+
+class ConcurrencyLimiter(object):
+  """Wraps a blocking prediction function with an adaptive concurrency limit.
+
+  Calls beyond the current limit wait in a bounded first-in, first-out
+  queue. When the queue is full, or a call has waited longer than
+  queue_timeout_s, the call is shed with RequestRejectedError rather than
+  sent to the server. The limiter is thread safe and is meant to be shared by
+  all threads sending requests.
+
+  Example:
+    stub = make_prediction_stub(host, port)
+    limiter = ConcurrencyLimiter(
+        functools.partial(predict_with_stub, stub), AIMDLimit())
+    result, elapsed = limiter.call(model, batch)
+  """
+
+  def __init__(self, predict_fn, limit=None, max_queue_size=16,
+               queue_timeout_s=1.0):
+    """Create a limiter.
+
+    Args:
+      predict_fn: blocking function that sends one request to the server
+      limit: an AIMDLimit or GradientLimit; defaults to AIMDLimit()
+      max_queue_size: maximum number of calls waiting for a free slot
+      queue_timeout_s: maximum time a call may wait for a free slot
+    """
+    self._predict_fn = predict_fn
+    self._limit = limit if limit is not None else AIMDLimit()
+    self.max_queue_size = max_queue_size
+    self.queue_timeout_s = queue_timeout_s
+    self._cond = threading.Condition()
+    self._in_flight = 0
+    self._waiters = collections.deque()
+    self.num_rejected = 0
+
+  @property
+  def limit(self):
+    """The current concurrency limit."""
+    with self._cond:
+      return max(1, self._limit.limit)
+
+  @property
+  def in_flight(self):
+    """The number of requests currently sent to the server."""
+    with self._cond:
+      return self._in_flight
+
+  @property
+  def queued(self):
+    """The number of calls currently waiting for a free slot."""
+    with self._cond:
+      return len(self._waiters)
+
+  def _acquire(self):
+    with self._cond:
+      # Only take a free slot directly if nobody is waiting for one, so that
+      # new calls can't jump ahead of queued ones.
+      if not self._waiters and self._in_flight < max(1, self._limit.limit):
+        self._in_flight += 1
+        return self._in_flight
+      if len(self._waiters) >= self.max_queue_size:
+        self.num_rejected += 1
+        raise RequestRejectedError('limiter queue is full')
+      waiter = object()
+      self._waiters.append(waiter)
+      deadline = time.time() + self.queue_timeout_s
+      try:
+        while (self._waiters[0] is not waiter or
+               self._in_flight >= max(1, self._limit.limit)):
+          remaining = deadline - time.time()
+          if remaining <= 0:
+            self.num_rejected += 1
+            raise RequestRejectedError('timed out waiting for a free slot')
+          self._cond.wait(remaining)
+      finally:
+        self._waiters.remove(waiter)
+        # Let the next waiter check whether it is now at the head.
+        self._cond.notify_all()
+      self._in_flight += 1
+      return self._in_flight
+
+  def _release(self, latency_ms, in_flight, dropped):
+    with self._cond:
+      self._in_flight -= 1
+      self._limit.update(latency_ms, in_flight, dropped)
+      self._cond.notify_all()
+
+  def call(self, *args, **kwargs):
+    """Send one request through predict_fn, respecting the current limit.
+
+    Returns:
+      whatever predict_fn returns
+
+    Raises:
+      RequestRejectedError: if the request was shed on the client
+    """
+    in_flight = self._acquire()
+    start_time = time.time()
+    dropped = True
+    try:
+      result = self._predict_fn(*args, **kwargs)
+      dropped = False
+      return result
+    finally:
+      latency_ms = (time.time() - start_time) * 1000
+      self._release(latency_ms, in_flight, dropped)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python2.7
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A fake tensorflow_model_server for benchmarking clients offline.
+
+The fake server implements PredictionService.Predict with the same contract
+as the served resnet model: it takes a batch of jpeg strings under 'images'
+and returns the top 5 'classes' and 'probabilities' for each image. No model
+is run. Instead, each request takes a configurable service time:
+  * fixed: every request takes --latency_ms
+  * lognormal: service times are lognormally distributed with median
+    --latency_ms and shape --latency_sigma, giving a long tail
+  * batch: --latency_ms plus --per_image_ms for every image in the batch
+
+Only --workers requests are served at once. Requests beyond that wait, first
+in first out, in a queue of up to --max_queue_size requests, and are rejected
+with RESOURCE_EXHAUSTED once the queue is full, so latency rises with load the
+way it does on a real server. Faults can be injected with --error_rate, which
+fails requests with --error_code, and --slow_rate, which multiplies the
+service time of some requests by --slow_factor.
+
+Predictions are derived from a hash of each jpeg, so the same image always
+gets the same classes, and runs with the same --seed see the same latencies.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import collections
+from concurrent import futures
+import hashlib
+import random
+import threading
+import time
+
+import grpc
+import numpy as np
+import tensorflow as tf
+from tensorflow_serving.apis import predict_pb2
+from tensorflow_serving.apis import prediction_service_pb2
+
+_ONE_DAY_IN_SECONDS = 60 * 60 * 24
+_LABEL_CLASSES = 1001
+_TOP_K = 5
+
+
+class FakePredictionServicer(prediction_service_pb2.PredictionServiceServicer):
+  """PredictionService that sleeps for a modeled service time."""
+
+  def __init__(self, latency_model='fixed', latency_ms=50.0,
+               latency_sigma=0.5, per_image_ms=5.0, workers=1,
+               max_queue_size=-1, error_rate=0.0,
+               error_code=grpc.StatusCode.UNAVAILABLE, slow_rate=0.0,
+               slow_factor=10.0, seed=None):
+    """Create a fake servicer.
+
+    Args:
+      latency_model: 'fixed', 'lognormal' or 'batch'
+      latency_ms: fixed service time, lognormal median, or batch base time
+      latency_sigma: shape of the lognormal distribution
+      per_image_ms: extra service time per image for the batch model
+      workers: number of requests served concurrently
+      max_queue_size: maximum number of requests waiting for a worker, or -1
+        for an unbounded queue
+      error_rate: fraction of requests that fail with error_code
+      error_code: grpc.StatusCode returned by failed requests
+      slow_rate: fraction of requests whose service time is multiplied by
+        slow_factor
+      slow_factor: service time multiplier of slow requests
+      seed: random seed for reproducible service times and faults
+    """
+    if latency_model not in ('fixed', 'lognormal', 'batch'):
+      raise ValueError('Invalid latency model ' + latency_model)
+    if workers < 1:
+      raise ValueError('workers must be at least 1')
+    self.latency_model = latency_model
+    self.latency_ms = latency_ms
+    self.latency_sigma = latency_sigma
+    self.per_image_ms = per_image_ms
+    self.workers = workers
+    self.max_queue_size = max_queue_size
+    self.error_rate = error_rate
+    self.error_code = error_code
+    self.slow_rate = slow_rate
+    self.slow_factor = slow_factor
+    self._random = random.Random(seed)
+    self._random_lock = threading.Lock()
+    self._cond = threading.Condition()
+    self._busy = 0
+    self._waiters = collections.deque()
+
+  def _service_time_ms(self, batch_size):
+    with self._random_lock:
+      if self.latency_model == 'lognormal':
+        service_ms = self.latency_ms * self._random.lognormvariate(
+            0, self.latency_sigma)
+      elif self.latency_model == 'batch':
+        service_ms = self.latency_ms + self.per_image_ms * batch_size
+      else:
+        service_ms = self.latency_ms
+      if self._random.random() < self.slow_rate:
+        service_ms *= self.slow_factor
+      failed = self._random.random() < self.error_rate
+    return service_ms, failed
+
+  def _acquire_worker(self):
+    with self._cond:
+      # Serve requests in arrival order: a new request only takes a free
+      # worker directly if nobody is waiting for one.
+      if not self._waiters and self._busy < self.workers:
+        self._busy += 1
+        return True
+      if (self.max_queue_size >= 0 and
+          len(self._waiters) >= self.max_queue_size):
+        return False
+      waiter = object()
+      self._waiters.append(waiter)
+      while self._waiters[0] is not waiter or self._busy >= self.workers:
+        self._cond.wait()
+      self._waiters.popleft()
+      self._busy += 1
+      # Let the next waiter check whether it is now at the head.
+      self._cond.notify_all()
+      return True
+
+  def _release_worker(self):
+    with self._cond:
+      self._busy -= 1
+      self._cond.notify_all()
+
+  def Predict(self, request, context):
+    if 'images' not in request.inputs:
+      context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+      context.set_details('Request is missing the \'images\' input')
+      return predict_pb2.PredictResponse()
+    try:
+      images = tf.make_ndarray(request.inputs['images'])
+    except (TypeError, ValueError) as e:
+      context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+      context.set_details('Malformed \'images\' input: %s' % e)
+      return predict_pb2.PredictResponse()
+    if images.ndim != 1 or images.dtype.kind not in ('S', 'O'):
+      context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+      context.set_details('\'images\' must be a 1-d tensor of jpeg strings')
+      return predict_pb2.PredictResponse()
+
+    if not self._acquire_worker():
+      context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+      context.set_details('Server queue is full')
+      return predict_pb2.PredictResponse()
+    try:
+      service_ms, failed = self._service_time_ms(len(images))
+      time.sleep(service_ms / 1000)
+    finally:
+      self._release_worker()
+
+    if failed:
+      context.set_code(self.error_code)
+      context.set_details('Injected fault')
+      return predict_pb2.PredictResponse()
+    return make_fake_response(request.model_spec, images)
+
+
+def fake_top_k(jpeg):
+  """Return deterministic top k classes and probabilities for one jpeg."""
+  image_random = np.random.RandomState(
+      int(hashlib.md5(jpeg).hexdigest()[:8], 16))
+  # The served model uses 0 as the miscellaneous class, so skip it.
+  classes = image_random.choice(
+      np.arange(1, _LABEL_CLASSES), _TOP_K, replace=False)
+  probabilities = np.sort(image_random.dirichlet(np.ones(_TOP_K + 1)))[::-1]
+  return classes.astype(np.int32), probabilities[:_TOP_K].astype(np.float32)
+
+
+def make_fake_response(model_spec, images):
+  """Build a PredictResponse with the same outputs as the served model."""
+  top_k = [fake_top_k(jpeg) for jpeg in images]
+  response = predict_pb2.PredictResponse()
+  response.model_spec.CopyFrom(model_spec)
+  response.outputs['classes'].CopyFrom(
+      tf.contrib.util.make_tensor_proto(
+          [classes for classes, _ in top_k],
+          shape=[len(images), _TOP_K],
+          dtype=tf.int32
+      )
+  )
+  response.outputs['probabilities'].CopyFrom(
+      tf.contrib.util.make_tensor_proto(
+          [probabilities for _, probabilities in top_k],
+          shape=[len(images), _TOP_K],
+          dtype=tf.float32
+      )
+  )
+  return response
+
+
+def main():
+  # Command line arguments
+  parser = argparse.ArgumentParser('Serve fake predictions for the cat model')
+  parser.add_argument(
+      '-p',
+      '--port',
+      type=int,
+      default=9000,
+      help='Port to serve on'
+  )
+  parser.add_argument(
+      '--latency_model',
+      type=str,
+      default='fixed',
+      choices=['fixed', 'lognormal', 'batch'],
+      help='Service time model. Default is \'fixed\''
+  )
+  parser.add_argument(
+      '--latency_ms',
+      type=float,
+      default=50.0,
+      help='Fixed service time, lognormal median, or batch base time in ms'
+  )
+  parser.add_argument(
+      '--latency_sigma',
+      type=float,
+      default=0.5,
+      help='Shape of the lognormal service time distribution'
+  )
+  parser.add_argument(
+      '--per_image_ms',
+      type=float,
+      default=5.0,
+      help='Service time per image in ms for the batch model'
+  )
+  parser.add_argument(
+      '-w',
+      '--workers',
+      type=int,
+      default=1,
+      help='Number of requests served concurrently'
+  )
+  parser.add_argument(
+      '-q',
+      '--max_queue_size',
+      type=int,
+      default=-1,
+      help='Maximum number of requests waiting for a worker. Default is -1, '
+           'an unbounded queue'
+  )
+  parser.add_argument(
+      '--error_rate',
+      type=float,
+      default=0.0,
+      help='Fraction of requests that fail'
+  )
+  parser.add_argument(
+      '--error_code',
+      type=str,
+      default='UNAVAILABLE',
+      choices=[code.name for code in grpc.StatusCode
+               if code != grpc.StatusCode.OK],
+      help='Status code of failed requests. Default is \'UNAVAILABLE\''
+  )
+  parser.add_argument(
+      '--slow_rate',
+      type=float,
+      default=0.0,
+      help='Fraction of requests that are slowed down'
+  )
+  parser.add_argument(
+      '--slow_factor',
+      type=float,
+      default=10.0,
+      help='Service time multiplier of slowed down requests'
+  )
+  parser.add_argument(
+      '--grpc_threads',
+      type=int,
+      default=64,
+      help='Number of grpc threads accepting requests. Requests beyond '
+           'this wait inside grpc rather than in the modeled queue'
+  )
+  parser.add_argument(
+      '--seed',
+      type=int,
+      default=None,
+      help='Random seed for reproducible service times and faults'
+  )
+  args = parser.parse_args()
+  if args.workers < 1:
+    parser.error('--workers must be at least 1')
+
+  servicer = FakePredictionServicer(
+      latency_model=args.latency_model,
+      latency_ms=args.latency_ms,
+      latency_sigma=args.latency_sigma,
+      per_image_ms=args.per_image_ms,
+      workers=args.workers,
+      max_queue_size=args.max_queue_size,
+      error_rate=args.error_rate,
+      error_code=getattr(grpc.StatusCode, args.error_code),
+      slow_rate=args.slow_rate,
+      slow_factor=args.slow_factor,
+      seed=args.seed)
+  server = grpc.server(
+      futures.ThreadPoolExecutor(max_workers=args.grpc_threads))
+  prediction_service_pb2.add_PredictionServiceServicer_to_server(
+      servicer, server)
+  server.add_insecure_port('[::]:%d' % args.port)
+  server.start()
+  print('Serving fake predictions on port %d' % args.port)
+  try:
+    while True:
+      time.sleep(_ONE_DAY_IN_SECONDS)
+  except KeyboardInterrupt:
+    server.stop(0)
+
+
+if __name__ == '__main__':
+  main()
@@ -37,24 +37,53 @@ def resize_and_pad_image(img, output_image_dim):
   return padded_img
 
 
-def preprocess_and_encode_images(image_paths, output_image_dim):
-  """Read an image, preprocess it, and encode as a jpeg.
+def encode_jpeg(img, quality=75, subsampling=None, optimize=False,
+                progressive=False):
+  """Encode an image as a jpeg string.
+
+  The defaults match PIL's own jpeg defaults. Lower quality and heavier
+  chroma subsampling send fewer bytes over the network at the cost of
+  fidelity. Optimize spends more client time computing huffman tables to
+  shave a few more bytes. Progressive encoding is left off by default since
+  the server decodes the whole image at once and gains nothing from it.
+
+  Args:
+    img: the input 3-color image
+    quality: jpeg quality, from 1 (worst) to 95 (best)
+    subsampling: chroma subsampling, 0 for 4:4:4, 1 for 4:2:2, 2 for 4:2:0,
+      or None to use PIL's default
+    optimize: whether to compute optimal huffman tables
+    progressive: whether to encode a progressive jpeg
+
+  Returns:
+    the image as a jpeg-encoded string
+  """
+  save_options = {
+      'quality': quality,
+      'optimize': optimize,
+      'progressive': progressive
+  }
+  if subsampling is not None:
+    save_options['subsampling'] = subsampling
+  jpeg_image = StringIO.StringIO()
+  img.save(jpeg_image, format='JPEG', **save_options)
+  return jpeg_image.getvalue()
+
+
+def load_and_resize_images(image_paths, output_image_dim):
+  """Read images and resize and pad them to output_image_dim.
 
   The image can be read from either a local path or url.
   The image must be RGB format.
-  Preprocessing involves resizing and padding until the image is exactly
-  output_image_dim x output_image_dim in size.
-  After preprocessing, the image is encoded as a jpeg string to reduce the
-  number of bytes. This jpeg string will be transmitted to the server.
 
   Args:
     image_paths: list of image paths and/or urls
     output_image_dim: resized and padded output length (and width)
 
   Returns:
-    the same images as a list of jpeg-encoded strings
+    list of resized and padded images
   """
-  jpeg_batch = []
+  images = []
 
   for image_path in image_paths:
     image = None
@@ -63,10 +92,29 @@ def preprocess_and_encode_images(image_paths, output_image_dim):
     else:
       image = Image.open(image_path)  # Parse the image from your local disk.
     # Resize and pad the image
-    image = resize_and_pad_image(image, output_image_dim)
-    jpeg_image = StringIO.StringIO()
-    image.save(jpeg_image, format='JPEG')
-    # Append to features_array
-    jpeg_batch.append(jpeg_image.getvalue())
+    images.append(resize_and_pad_image(image, output_image_dim))
+
+  return images
+
 
-  return jpeg_batch
\ No newline at end of file
+def preprocess_and_encode_images(image_paths, output_image_dim, **jpeg_options):
+  """Read an image, preprocess it, and encode as a jpeg.
+
+  The image can be read from either a local path or url.
+  The image must be RGB format.
+  Preprocessing involves resizing and padding until the image is exactly
+  output_image_dim x output_image_dim in size.
+  After preprocessing, the image is encoded as a jpeg string to reduce the
+  number of bytes. This jpeg string will be transmitted to the server.
+
+  Args:
+    image_paths: list of image paths and/or urls
+    output_image_dim: resized and padded output length (and width)
+    **jpeg_options: encoding options passed on to encode_jpeg, i.e.
+      quality, subsampling, optimize and progressive
+
+  Returns:
+    the same images as a list of jpeg-encoded strings
+  """
+  return [encode_jpeg(image, **jpeg_options)
+          for image in load_and_resize_images(image_paths, output_image_dim)]
@@ -29,6 +29,7 @@ import csv
 import json
 import time
 
+import grpc
 from grpc.beta import implementations
 import numpy as np
 import tensorflow as tf
@@ -38,6 +39,55 @@ from google.protobuf import json_format
 
 from image_processing import preprocess_and_encode_images
 
+# Values of the grpc.default_compression_algorithm channel argument.
+COMPRESSION_ALGORITHMS = {'none': 0, 'deflate': 1, 'gzip': 2}
+
+
+def add_encoding_arguments(parser):
+  """Add jpeg encoding and grpc compression options to an argument parser."""
+  parser.add_argument(
+      '--jpeg_quality',
+      type=int,
+      default=75,
+      help='Jpeg quality from 1 (worst) to 95 (best). Default is 75'
+  )
+  parser.add_argument(
+      '--jpeg_subsampling',
+      type=int,
+      default=None,
+      choices=[0, 1, 2],
+      help='Jpeg chroma subsampling: 0 for 4:4:4, 1 for 4:2:2, 2 for 4:2:0. '
+           'Defaults to PIL\'s default'
+  )
+  parser.add_argument(
+      '--jpeg_optimize',
+      action='store_true',
+      help='Compute optimal jpeg huffman tables'
+  )
+  parser.add_argument(
+      '--jpeg_progressive',
+      action='store_true',
+      help='Encode progressive jpegs'
+  )
+  parser.add_argument(
+      '--compression',
+      type=str,
+      default='none',
+      choices=sorted(COMPRESSION_ALGORITHMS.keys()),
+      help='grpc message compression. Default is \'none\''
+  )
+
+
+def jpeg_options_from_args(args):
+  """Collect the encode_jpeg options from parsed command line arguments."""
+  return {
+      'quality': args.jpeg_quality,
+      'subsampling': args.jpeg_subsampling,
+      'optimize': args.jpeg_optimize,
+      'progressive': args.jpeg_progressive
+  }
+
+
 def main():
   # Command line arguments
   parser = argparse.ArgumentParser('Label an image using the cat model')
@@ -76,6 +126,7 @@ def main():
       help='Model implementation type.'
            'Default is \'estimator\'. Other options: \'keras\''
   )
+  add_encoding_arguments(parser)
   parser.add_argument(
       'images',
       type=str,
@@ -87,11 +138,13 @@ def main():
   images = args.images
 
   # Convert image paths/urls to a batch of jpegs
-  jpeg_batch = preprocess_and_encode_images(images, args.dim)
+  jpeg_batch = preprocess_and_encode_images(
+      images, args.dim, **jpeg_options_from_args(args))
 
   # Call the server to predict top 5 classes and probabilities, and time taken
   result, elapsed = predict_and_profile(
-      args.server, args.port, args.model, jpeg_batch)
+      args.server, args.port, args.model, jpeg_batch,
+      compression=args.compression)
 
   # Parse server message and print formatted results
   json_result = json.loads(json_format.MessageToJson(result))
@@ -123,11 +176,43 @@ def main():
       print(class_and_probs[i][j])
 
 
-def predict_and_profile(host, port, model, batch):
+def predict_and_profile(host, port, model, batch, timeout=60.0,
+                        compression='none'):
+  stub = make_prediction_stub(host, port, compression)
+  return predict_with_stub(stub, model, batch, timeout)
 
+
+def make_prediction_stub(host, port, compression='none'):
+  """Open a channel to the TF server and return a PredictionService stub.
+
+  The stub can be shared by many threads. Reuse it for repeated requests to
+  avoid setting up a new connection for every request.
+  """
+  if compression == 'none':
+    channel = implementations.insecure_channel(host, int(port))
+  else:
+    # The beta API can't set channel options, so build the channel with the
+    # compression option and wrap it for the beta stub.
+    channel = implementations.Channel(grpc.insecure_channel(
+        '%s:%d' % (host, int(port)),
+        options=[('grpc.default_compression_algorithm',
+                  COMPRESSION_ALGORITHMS[compression])]))
+  return prediction_service_pb2.beta_create_PredictionService_stub(channel)
+
+
+def predict_with_stub(stub, model, batch, timeout=60.0):
   # Prepare the RPC request to send to the TF server.
-  channel = implementations.insecure_channel(host, int(port))
-  stub = prediction_service_pb2.beta_create_PredictionService_stub(channel)
+  request = make_predict_request(model, batch)
+
+  # Call the server to predict, return the result, and compute round trip time
+  start_time = int(round(time.time() * 1000))
+  result = stub.Predict(request, timeout)
+  elapsed = int(round(time.time() * 1000)) - start_time
+
+  return result, elapsed
+
+
+def make_predict_request(model, batch):
   request = predict_pb2.PredictRequest()
   request.model_spec.name = model
 
@@ -144,12 +229,7 @@ def predict_and_profile(host, port, model, batch):
       )
   )
 
-  # Call the server to predict, return the result, and compute round trip time
-  start_time = int(round(time.time() * 1000))
-  result = stub.Predict(request, 60.0)  # 60 second timeout
-  elapsed = int(round(time.time() * 1000)) - start_time
-
-  return result, elapsed
+  return request
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python2.7
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sweep jpeg encoding and grpc compression settings to shrink payloads.
+
+For clients far from the server, the bytes sent over the network often
+dominate latency. This tool encodes the same images with every combination of
+jpeg quality, chroma subsampling and grpc compression, and reports for each:
+  * jpeg bytes per image, and estimated request bytes per image on the wire
+    after grpc compression
+  * client encode time per image
+  * server decode time per image, estimated by decoding a batch with the
+    same tf.image.decode_jpeg op the served model uses, on this machine
+  * if a server is given, the median round trip time and the top-5 agreement
+    with a baseline encoding at quality 95 with no chroma subsampling.
+
+Top-5 agreement is the average fraction of the baseline's top 5 classes that
+the setting also returns; top-1 is the fraction of images whose most probable
+class matches the baseline.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import itertools
+import math
+import time
+import zlib
+
+import numpy as np
+import tensorflow as tf
+
+from image_processing import encode_jpeg
+from image_processing import load_and_resize_images
+from resnet_client import COMPRESSION_ALGORITHMS
+from resnet_client import make_predict_request
+from resnet_client import predict_and_profile
+
+_BASELINE_OPTIONS = {'quality': 95, 'subsampling': 0}
+_DECODE_BATCH_SIZE = 64
+
+
+def time_encoding(images, jpeg_options):
+  """Encode images, returning the jpegs and mean encode time in ms."""
+  start_time = time.time()
+  jpegs = [encode_jpeg(image, **jpeg_options) for image in images]
+  return jpegs, (time.time() - start_time) * 1000 / len(images)
+
+
+def time_decoding(sess, jpeg_placeholder, decode_op, jpegs,
+                  batch_size=_DECODE_BATCH_SIZE, num_trials=10):
+  """Return the median time in ms for decode_op to decode one jpeg.
+
+  The jpegs are repeated to fill a batch of at least batch_size and decoded
+  in a single session run, as the served model decodes a request, so that
+  the per-run session overhead is spread over many images.
+  """
+  batch = jpegs * int(math.ceil(batch_size / len(jpegs)))
+  # Warm up once so that graph setup isn't counted.
+  sess.run(decode_op, feed_dict={jpeg_placeholder: batch})
+  elapsed_times = []
+  for _ in range(num_trials):
+    start_time = time.time()
+    sess.run(decode_op, feed_dict={jpeg_placeholder: batch})
+    elapsed_times.append((time.time() - start_time) * 1000 / len(batch))
+  return np.median(elapsed_times)
+
+
+def wire_bytes(request, compression):
+  """Estimate the size of a request on the wire after grpc compression."""
+  serialized = request.SerializeToString()
+  if compression == 'none':
+    return len(serialized)
+  # gzip and deflate both use zlib's deflate; only their headers differ.
+  return len(zlib.compress(serialized))
+
+
+def top_k_classes(result):
+  """Return the predicted classes of a response as a batch x k array."""
+  return tf.make_ndarray(result.outputs['classes'])
+
+
+def main():
+  # Command line arguments
+  parser = argparse.ArgumentParser('Sweep jpeg encoding settings')
+  parser.add_argument(
+      '-s',
+      '--server',
+      help='URL of host serving the cat model. If omitted, only sizes and '
+           'encode/decode times are reported'
+  )
+  parser.add_argument(
+      '-p',
+      '--port',
+      type=int,
+      default=9000,
+      help='Port at which cat model is being served'
+  )
+  parser.add_argument(
+      '-m',
+      '--model',
+      type=str,
+      default='resnet',
+      help='Name of the served model'
+  )
+  parser.add_argument(
+      '-d',
+      '--dim',
+      type=int,
+      default=224,
+      help='Size of (square) image, an integer indicating its width and '
+           'height. Resnet\'s default is 224'
+  )
+  parser.add_argument(
+      '--qualities',
+      type=int,
+      nargs='+',
+      default=[95, 85, 75, 50, 30],
+      help='Jpeg qualities to try'
+  )
+  parser.add_argument(
+      '--subsamplings',
+      type=int,
+      nargs='+',
+      default=[0, 2],
+      choices=[0, 1, 2],
+      help='Jpeg chroma subsamplings to try: 0 for 4:4:4, 1 for 4:2:2, '
+           '2 for 4:2:0'
+  )
+  parser.add_argument(
+      '--compressions',
+      type=str,
+      nargs='+',
+      default=['none', 'gzip'],
+      choices=sorted(COMPRESSION_ALGORITHMS.keys()),
+      help='grpc compression algorithms to try'
+  )
+  parser.add_argument(
+      '--jpeg_optimize',
+      action='store_true',
+      help='Compute optimal jpeg huffman tables for every setting'
+  )
+  parser.add_argument(
+      '--jpeg_progressive',
+      action='store_true',
+      help='Encode progressive jpegs for every setting'
+  )
+  parser.add_argument(
+      '-n',
+      '--num_trials',
+      type=int,
+      default=5,
+      help='Number of requests sent to the server per setting'
+  )
+  parser.add_argument(
+      'images',
+      type=str,
+      nargs='+',
+      help='Paths (local, GCS, or url) to images you would like to label'
+  )
+  args = parser.parse_args()
+  if args.num_trials < 1:
+    parser.error('--num_trials must be at least 1')
+
+  images = load_and_resize_images(args.images, args.dim)
+
+  jpeg_placeholder = tf.placeholder(tf.string, shape=[None])
+  decode_op = tf.map_fn(
+      lambda jpeg: tf.image.decode_jpeg(jpeg, channels=3),
+      jpeg_placeholder,
+      dtype=tf.uint8
+  )
+  sess = tf.Session()
+
+  baseline_classes = None
+  if args.server:
+    baseline_jpegs = [encode_jpeg(image, **_BASELINE_OPTIONS)
+                      for image in images]
+    result, _ = predict_and_profile(
+        args.server, args.port, args.model, baseline_jpegs)
+    baseline_classes = top_k_classes(result)
+
+  print('Local decode ms is decode_jpeg time measured on this machine, an '
+        'estimate of the server\'s decode time.')
+  header = '%8s %12s %12s %12s %12s %10s %16s' % (
+      'Quality', 'Subsampling', 'Compression', 'Bytes/image', 'Wire/image',
+      'Encode ms', 'Local decode ms')
+  if baseline_classes is not None:
+    header += ' %8s %8s %8s' % ('RTT ms', 'Top-5', 'Top-1')
+  print(header)
+
+  for quality, subsampling in itertools.product(args.qualities,
+                                                args.subsamplings):
+    jpeg_options = {
+        'quality': quality,
+        'subsampling': subsampling,
+        'optimize': args.jpeg_optimize,
+        'progressive': args.jpeg_progressive
+    }
+    jpegs, encode_ms = time_encoding(images, jpeg_options)
+    decode_ms = time_decoding(sess, jpeg_placeholder, decode_op, jpegs)
+    bytes_per_image = np.mean([len(jpeg) for jpeg in jpegs])
+    request = make_predict_request(args.model, jpegs)
+
+    for compression in args.compressions:
+      row = '%8d %12d %12s %12d %12d %10.2f %16.2f' % (
+          quality, subsampling, compression, bytes_per_image,
+          wire_bytes(request, compression) / len(jpegs), encode_ms,
+          decode_ms)
+      if baseline_classes is not None:
+        elapsed_times = []
+        for _ in range(args.num_trials):
+          result, elapsed = predict_and_profile(
+              args.server, args.port, args.model, jpegs,
+              compression=compression)
+          elapsed_times.append(elapsed)
+        classes = top_k_classes(result)
+        top5 = np.mean([
+            len(set(c) & set(b)) / len(b)
+            for c, b in zip(classes, baseline_classes)])
+        top1 = np.mean(classes[:, 0] == baseline_classes[:, 0])
+        row += ' %8.1f %8.3f %8.3f' % (np.median(elapsed_times), top5, top1)
+      print(row)
+
+
+if __name__ == '__main__':
+  main()
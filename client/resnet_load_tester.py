@@ -0,0 +1,287 @@
+#!/usr/bin/env python2.7
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A load tester that sends requests at a fixed rate, with or without limits.
+
+Unlike resnet_profiler.py, which sends one request at a time, the load tester
+sends requests at a fixed arrival rate regardless of how quickly the server
+answers (an open loop), which is how independent producers behave. If the
+rate is higher than the server can sustain, requests pile up and latency
+collapses. Running the same load with --limiter aimd or --limiter gradient
+shows the adaptive concurrency limiter shedding excess work instead, keeping
+the latency of the requests that are served stable.
+
+Use --simulate to run against an in-process stand-in whose service time grows
+with the number of requests in flight, so no model server is needed. For a
+more realistic setup, point the load tester at fake_prediction_server.py.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import functools
+import threading
+import time
+
+import numpy as np
+
+from concurrency_limiter import AIMDLimit
+from concurrency_limiter import ConcurrencyLimiter
+from concurrency_limiter import GradientLimit
+from concurrency_limiter import RequestRejectedError
+from image_processing import preprocess_and_encode_images
+
+
+class SimulatedPredictor(object):
+  """Stand-in for predict_with_stub whose service time rises with load.
+
+  Up to `capacity` requests are served in base_ms each. Beyond that, every
+  request in flight slows down in proportion to the overload, the way a
+  server that shares its CPUs/GPUs between all queued requests does.
+  """
+
+  def __init__(self, base_ms=50.0, capacity=4):
+    self.base_ms = base_ms
+    self.capacity = capacity
+    self._lock = threading.Lock()
+    self._in_flight = 0
+
+  def __call__(self, model, batch, timeout=60.0):
+    with self._lock:
+      self._in_flight += 1
+      load = self._in_flight
+    service_ms = self.base_ms * max(1.0, load / self.capacity)
+    start_time = time.time()
+    try:
+      time.sleep(min(service_ms / 1000, timeout))
+      if service_ms / 1000 > timeout:
+        raise RuntimeError('deadline exceeded')
+    finally:
+      with self._lock:
+        self._in_flight -= 1
+    return None, int(round((time.time() - start_time) * 1000))
+
+
+def main():
+  # Command line arguments
+  parser = argparse.ArgumentParser('Send load to the cat model')
+  parser.add_argument(
+      '-s',
+      '--server',
+      help='URL of host serving the cat model'
+  )
+  parser.add_argument(
+      '-p',
+      '--port',
+      type=int,
+      default=9000,
+      help='Port at which cat model is being served'
+  )
+  parser.add_argument(
+      '-m',
+      '--model',
+      type=str,
+      default='resnet',
+      help='Name of the served model'
+  )
+  parser.add_argument(
+      '-d',
+      '--dim',
+      type=int,
+      default=224,
+      help='Size of (square) image, an integer indicating its width and '
+           'height. Resnet\'s default is 224'
+  )
+  parser.add_argument(
+      '--rate',
+      type=float,
+      default=120.0,
+      help='Requests sent per second. The default overloads the --simulate '
+           'stand-in, which serves at most 80 requests per second'
+  )
+  parser.add_argument(
+      '--duration',
+      type=float,
+      default=10.0,
+      help='Number of seconds to send requests for'
+  )
+  parser.add_argument(
+      '--timeout',
+      type=float,
+      default=60.0,
+      help='Deadline of each request in seconds'
+  )
+  parser.add_argument(
+      '--limiter',
+      type=str,
+      default='none',
+      choices=['none', 'aimd', 'gradient'],
+      help='Concurrency limit algorithm. Default is \'none\''
+  )
+  parser.add_argument(
+      '--initial_limit',
+      type=int,
+      default=4,
+      help='Initial concurrency limit'
+  )
+  parser.add_argument(
+      '--max_limit',
+      type=int,
+      default=64,
+      help='Maximum concurrency limit'
+  )
+  parser.add_argument(
+      '--latency_threshold_ms',
+      type=float,
+      default=None,
+      help='Smoothed latency above which the aimd limiter backs off. '
+           'Defaults to --latency_tolerance times the no-load latency'
+  )
+  parser.add_argument(
+      '--latency_tolerance',
+      type=float,
+      default=1.5,
+      help='Multiple of the no-load latency that the limiters treat as '
+           'queueing. Lower values keep latency closer to the no-load '
+           'latency but shed more requests'
+  )
+  parser.add_argument(
+      '--max_queue_size',
+      type=int,
+      default=16,
+      help='Maximum number of requests waiting on the client for a free slot'
+  )
+  parser.add_argument(
+      '--queue_timeout',
+      type=float,
+      default=0.5,
+      help='Seconds a request may wait on the client for a free slot'
+  )
+  parser.add_argument(
+      '--simulate',
+      action='store_true',
+      help='Use an in-process stand-in whose service time grows with load '
+           'instead of a model server'
+  )
+  parser.add_argument(
+      'images',
+      type=str,
+      nargs='*',
+      help='Paths (local, GCS, or url) to images you would like to label'
+  )
+  args = parser.parse_args()
+  if not args.simulate and not args.images:
+    parser.error('images are required unless --simulate is set')
+
+  if args.simulate:
+    predict_fn = SimulatedPredictor()
+    jpeg_batch = []
+  else:
+    # Imported here so that --simulate works without tensorflow installed.
+    from resnet_client import make_prediction_stub
+    from resnet_client import predict_with_stub
+    # Share one channel between all requests, so that connection setup is
+    # neither counted in the latency nor added to the server's load.
+    predict_fn = functools.partial(
+        predict_with_stub, make_prediction_stub(args.server, args.port))
+    jpeg_batch = preprocess_and_encode_images(args.images, args.dim)
+
+  limiter = None
+  if args.limiter == 'aimd':
+    limiter = ConcurrencyLimiter(
+        predict_fn,
+        AIMDLimit(initial_limit=args.initial_limit,
+                  max_limit=args.max_limit,
+                  latency_threshold_ms=args.latency_threshold_ms,
+                  latency_tolerance=args.latency_tolerance),
+        max_queue_size=args.max_queue_size,
+        queue_timeout_s=args.queue_timeout)
+  elif args.limiter == 'gradient':
+    limiter = ConcurrencyLimiter(
+        predict_fn,
+        GradientLimit(initial_limit=args.initial_limit,
+                      max_limit=args.max_limit,
+                      latency_tolerance=args.latency_tolerance),
+        max_queue_size=args.max_queue_size,
+        queue_timeout_s=args.queue_timeout)
+
+  lock = threading.Lock()
+  elapsed_times = []
+  counts = {'rejected': 0, 'failed': 0}
+
+  def send_request():
+    start_time = time.time()
+    try:
+      if limiter is not None:
+        limiter.call(args.model, jpeg_batch, args.timeout)
+      else:
+        predict_fn(args.model, jpeg_batch, args.timeout)
+    except RequestRejectedError:
+      with lock:
+        counts['rejected'] += 1
+      return
+    except Exception:  # pylint: disable=broad-except
+      with lock:
+        counts['failed'] += 1
+      return
+    with lock:
+      elapsed_times.append((time.time() - start_time) * 1000)
+
+  print('Rate: %0.1f requests/s for %0.1f s' % (args.rate, args.duration))
+  print('Limiter: ' + args.limiter)
+
+  # Send requests on an open loop: one new thread per request at fixed
+  # intervals, whether or not earlier requests have returned.
+  threads = []
+  interval = 1.0 / args.rate
+  start_time = time.time()
+  next_report = start_time + 1.0
+  num_sent = 0
+  while time.time() - start_time < args.duration:
+    thread = threading.Thread(target=send_request)
+    thread.daemon = True
+    thread.start()
+    threads.append(thread)
+    num_sent += 1
+    if time.time() >= next_report:
+      with lock:
+        latencies = list(elapsed_times[-int(args.rate):])
+      status = 'Sent: %d' % num_sent
+      if latencies:
+        status += ', recent median: %0.2f ms' % np.median(latencies)
+      if limiter is not None:
+        status += ', limit: %d, in flight: %d, queued: %d' % (
+            limiter.limit, limiter.in_flight, limiter.queued)
+      print(status)
+      next_report += 1.0
+    time.sleep(max(0, start_time + num_sent * interval - time.time()))
+  for thread in threads:
+    thread.join()
+
+  print('Sent: %d' % num_sent)
+  print('Completed: %d' % len(elapsed_times))
+  print('Rejected: %d' % counts['rejected'])
+  print('Failed: %d' % counts['failed'])
+  if elapsed_times:
+    print('Mean: %0.2f' % np.mean(elapsed_times))
+    print('Median: %0.2f' % np.median(elapsed_times))
+    print('99th percentile: %0.2f' % np.percentile(elapsed_times, 99))
+    print('Max: %0.2f' % np.max(elapsed_times))
+
+
+if __name__ == '__main__':
+  main()
@@ -29,6 +29,8 @@ import argparse
 import numpy as np
 
 from image_processing import preprocess_and_encode_images
+from resnet_client import add_encoding_arguments
+from resnet_client import jpeg_options_from_args
 from resnet_client import predict_and_profile
 
 
@@ -90,13 +92,15 @@ def main():
       default=10,
       help='Number of requests to send to the server'
   )
+  add_encoding_arguments(parser)
   args = parser.parse_args()
 
   # Preprocess images at the client and compress as jpeg
   img_size = args.dim
   images = args.images
 
-  jpeg_batch = preprocess_and_encode_images(images, img_size)
+  jpeg_batch = preprocess_and_encode_images(
+      images, img_size, **jpeg_options_from_args(args))
 
   # Create r copies of the array for profiling.
   batch_array = []
@@ -111,7 +115,8 @@ def main():
   for t in range(0, args.num_trials):
     # Call the server to predict top 5 classes and probabilities, and time taken
     result, elapsed = predict_and_profile(
-        args.server, args.port, args.model, batch_array)
+        args.server, args.port, args.model, batch_array,
+        compression=args.compression)
     # Print and log the delay
     print('Request delay: ' + str(elapsed) + ' ms')
     elapsed_times.append(elapsed)
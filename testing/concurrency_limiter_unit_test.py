@@ -0,0 +1,201 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the client's adaptive concurrency limiter.
+
+The limiter is pure python, so these tests need neither tensorflow nor a
+model server. The limits are driven by a simulated server in a closed loop:
+the client always has limit requests in flight, and each request's latency is
+the server's service time, stretched once more requests are in flight than
+the server can serve at once, times lognormal noise.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../client'))
+from concurrency_limiter import AIMDLimit
+from concurrency_limiter import ConcurrencyLimiter
+from concurrency_limiter import GradientLimit
+from concurrency_limiter import RequestRejectedError
+
+_BASE_MS = 50.0
+
+
+def run_closed_loop(limit, capacity, sigma, num_requests=20000, seed=0):
+  """Drive a limit against a simulated server.
+
+  Returns:
+    the limits in use over the second half of the run
+  """
+  rand = random.Random(seed)
+  limits = []
+  for i in range(num_requests):
+    in_flight = max(1, limit.limit)
+    latency_ms = _BASE_MS * max(1.0, in_flight / float(capacity))
+    if sigma:
+      latency_ms *= rand.lognormvariate(0, sigma)
+    limit.update(latency_ms, in_flight, False)
+    if i >= num_requests // 2:
+      limits.append(in_flight)
+  return limits
+
+
+def mean(values):
+  return sum(values) / float(len(values))
+
+
+class AIMDLimitTest(unittest.TestCase):
+  '''Test AIMDLimit against simulated servers.'''
+  def testGrowsBelowCapacity(self):
+    limits = run_closed_loop(AIMDLimit(max_limit=64), 1e9, 0)
+    self.assertEqual(max(limits), 64)
+
+  def testBacksOffOnDrop(self):
+    limit = AIMDLimit(initial_limit=20)
+    limit.update(_BASE_MS, 20, True)
+    self.assertEqual(limit.limit, 18)
+
+  def testBacksOffOnSlowRequests(self):
+    limit = AIMDLimit(initial_limit=20)
+    for _ in range(100):
+      limit.update(_BASE_MS, 20, False)
+    before = limit.limit
+    for _ in range(100):
+      limit.update(4 * _BASE_MS, 20, False)
+    self.assertLess(limit.limit, before)
+
+  def testNoCollapseUnderVariableLatency(self):
+    limits = run_closed_loop(AIMDLimit(max_limit=64), 1e9, 0.5)
+    self.assertGreater(mean(limits), 32)
+
+  def testSettlesNearCapacityUnderOverload(self):
+    limits = run_closed_loop(AIMDLimit(max_limit=64), 4, 0.5)
+    self.assertGreaterEqual(mean(limits), 2)
+    self.assertLessEqual(mean(limits), 12)
+    self.assertLess(max(limits), 32)
+
+
+class GradientLimitTest(unittest.TestCase):
+  '''Test GradientLimit against simulated servers.'''
+  def testGrowsBelowCapacity(self):
+    limits = run_closed_loop(GradientLimit(max_limit=64), 1e9, 0)
+    self.assertEqual(max(limits), 64)
+
+  def testBacksOffOnDrop(self):
+    limit = GradientLimit(initial_limit=20)
+    limit.update(_BASE_MS, 20, True)
+    self.assertEqual(limit.limit, 10)
+
+  def testBacksOffOnSlowRequests(self):
+    limit = GradientLimit(initial_limit=20, max_limit=20)
+    for _ in range(100):
+      limit.update(_BASE_MS, 20, False)
+    for _ in range(100):
+      limit.update(4 * _BASE_MS, 20, False)
+    self.assertLess(limit.limit, 20)
+
+  def testNoCollapseUnderVariableLatency(self):
+    limits = run_closed_loop(GradientLimit(max_limit=64), 1e9, 0.5)
+    self.assertGreater(mean(limits), 32)
+
+  def testSettlesNearCapacityUnderOverload(self):
+    limits = run_closed_loop(GradientLimit(max_limit=64), 4, 0.5)
+    self.assertGreaterEqual(mean(limits), 4)
+    self.assertLessEqual(mean(limits), 16)
+    self.assertLess(max(limits), 32)
+
+
+class _FixedLimit(object):
+  '''A limit that never changes, to test queueing in isolation.'''
+  def __init__(self, limit):
+    self.limit = limit
+
+  def update(self, latency_ms, in_flight, dropped):
+    pass
+
+
+class ConcurrencyLimiterTest(unittest.TestCase):
+  '''Test queueing and shedding with a blocking fake prediction function.'''
+  def setUp(self):
+    self.release = threading.Event()
+    self.calls = []
+
+  def predict(self, name):
+    self.calls.append(name)
+    self.release.wait()
+    return name
+
+  def startCall(self, limiter, name, errors=None):
+    def call():
+      try:
+        limiter.call(name)
+      except RequestRejectedError:
+        if errors is not None:
+          errors.append(name)
+    thread = threading.Thread(target=call)
+    thread.start()
+    return thread
+
+  def waitFor(self, condition):
+    deadline = time.time() + 5
+    while not condition() and time.time() < deadline:
+      time.sleep(0.001)
+    self.assertTrue(condition())
+
+  def testShedsWhenQueueIsFull(self):
+    limiter = ConcurrencyLimiter(self.predict, _FixedLimit(1),
+                                 max_queue_size=1, queue_timeout_s=5)
+    threads = [self.startCall(limiter, 'first')]
+    self.waitFor(lambda: limiter.in_flight == 1)
+    threads.append(self.startCall(limiter, 'second'))
+    self.waitFor(lambda: limiter.queued == 1)
+    self.assertRaises(RequestRejectedError, limiter.call, 'third')
+    self.release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(self.calls, ['first', 'second'])
+    self.assertEqual(limiter.num_rejected, 1)
+
+  def testShedsAfterQueueTimeout(self):
+    limiter = ConcurrencyLimiter(self.predict, _FixedLimit(1),
+                                 max_queue_size=4, queue_timeout_s=0.05)
+    thread = self.startCall(limiter, 'first')
+    self.waitFor(lambda: limiter.in_flight == 1)
+    self.assertRaises(RequestRejectedError, limiter.call, 'second')
+    self.assertEqual(limiter.queued, 0)
+    self.release.set()
+    thread.join()
+    self.assertEqual(self.calls, ['first'])
+
+  def testServesQueuedCallsInOrder(self):
+    limiter = ConcurrencyLimiter(self.predict, _FixedLimit(1),
+                                 max_queue_size=4, queue_timeout_s=5)
+    threads = [self.startCall(limiter, 'first')]
+    self.waitFor(lambda: limiter.in_flight == 1)
+    for i, name in enumerate(['second', 'third', 'fourth']):
+      threads.append(self.startCall(limiter, name))
+      self.waitFor(lambda: limiter.queued == i + 1)
+    self.release.set()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(self.calls, ['first', 'second', 'third', 'fourth'])
+
+
+if __name__ == '__main__':
+  unittest.main()